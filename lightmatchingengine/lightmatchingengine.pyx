@@ -1,9 +1,40 @@
 #!/usr/bin/python3
+from libc.stdint cimport int64_t, uint8_t
+from libc.string cimport memcpy, memset
+
+import csv
+import mmap
+import os
+import struct
+
+
+cdef extern from *:
+    """
+    #if defined(_MSC_VER)
+    #include <windows.h>
+    #define lme_memory_barrier() MemoryBarrier()
+    #else
+    #define lme_memory_barrier() __sync_synchronize()
+    #endif
+    """
+    void lme_memory_barrier()
+
+
 cpdef enum Side:
     BUY = 1
     SELL = 2
 
 
+cpdef enum ExecType:
+    NEW = 1
+    PARTIAL_FILL = 2
+    FILL = 3
+    CANCEL = 4
+    AMEND = 5
+    REJECT = 6
+    EXPIRE = 7
+
+
 cdef class Order:
     cdef public int order_id
     cdef public str instmt
@@ -12,8 +43,9 @@ cdef class Order:
     cdef public double cum_qty
     cdef public double leaves_qty
     cdef public Side side
+    cdef public long long expire_time
 
-    def __init__(self, order_id, instmt, price, qty, side):
+    def __init__(self, order_id, instmt, price, qty, side, expire_time=0):
         """
         Constructor
         """
@@ -24,6 +56,56 @@ cdef class Order:
         self.cum_qty = 0
         self.leaves_qty = qty
         self.side = side
+        self.expire_time = expire_time
+
+    def __reduce__(self):
+        return (Order,
+                (self.order_id, self.instmt, self.price, self.qty, self.side,
+                 self.expire_time),
+                (self.cum_qty, self.leaves_qty))
+
+    def __setstate__(self, state):
+        self.cum_qty, self.leaves_qty = state
+
+
+cdef Order copy_order(Order order):
+    """
+    Copy an order without going through the constructor
+    """
+    cdef Order copy = Order.__new__(Order)
+    copy.order_id = order.order_id
+    copy.instmt = order.instmt
+    copy.price = order.price
+    copy.qty = order.qty
+    copy.cum_qty = order.cum_qty
+    copy.leaves_qty = order.leaves_qty
+    copy.side = order.side
+    copy.expire_time = order.expire_time
+    return copy
+
+
+cdef Py_ssize_t find_order_index(list price_level, Order order):
+    """
+    Locate an order in its price level
+    The orders of a price level are in ascending order id by time
+    priority, so the order is located by binary search.
+    :return The index of the order, -1 if it is not in the price level
+    """
+    cdef Py_ssize_t index = 0
+    cdef Py_ssize_t upper = len(price_level)
+    cdef Py_ssize_t middle
+
+    while index < upper:
+        middle = (index + upper) // 2
+        if (<Order> price_level[middle]).order_id < order.order_id:
+            index = middle + 1
+        else:
+            upper = middle
+
+    if index == len(price_level) or price_level[index] is not order:
+        return -1
+
+    return index
 
 
 cdef class OrderBook:
@@ -39,6 +121,112 @@ cdef class OrderBook:
         self.asks = {}
         self.order_id_map = {}
 
+    def __reduce__(self):
+        return (OrderBook, (), (self.bids, self.asks, self.order_id_map))
+
+    def __setstate__(self, state):
+        self.bids, self.asks, self.order_id_map = state
+
+    cpdef OrderBook clone(self):
+        """
+        Clone the order book
+        The price levels and their orders are copied in one pass, so the
+        clone and this book never share any mutable object.
+        :return The cloned order book
+        """
+        cdef OrderBook order_book = OrderBook.__new__(OrderBook)
+        cdef dict order_id_map = {}
+        cdef list price_level
+        cdef Order order
+
+        order_book.bids = {}
+        order_book.asks = {}
+        for depth, cloned_depth in ((self.bids, order_book.bids),
+                                    (self.asks, order_book.asks)):
+            for price, orders in depth.items():
+                price_level = [copy_order(order) for order in orders]
+                for order in price_level:
+                    order_id_map[order.order_id] = order
+                cloned_depth[price] = price_level
+
+        order_book.order_id_map = order_id_map
+        return order_book
+
+    cpdef validate(self):
+        """
+        Check the invariants of the order book
+        - Every price level is non-empty and holds orders of its side and
+          price, with positive leaves quantity
+        - No price level is at the zero market order price
+        - The order quantity equals the cum and leaves quantities
+        - The orders of a price level are in time priority, i.e. order id
+        - The order id map covers exactly the orders in the price levels
+        - The book is not crossed
+        No quantity total is stored per price level, so the level quantity
+        is only checked to be positive. The checks are explicit, so they
+        also run under python -O.
+        :raise AssertionError if any invariant is violated
+        """
+        cdef Order order
+        cdef Order prev_order
+        cdef int num_orders = 0
+        cdef double level_qty
+
+        for side, depth in ((Side.BUY, self.bids), (Side.SELL, self.asks)):
+            for price, price_level in depth.items():
+                if len(price_level) == 0:
+                    raise AssertionError(
+                        "Empty price level %s at side %s" % (price, side))
+                if price == 0.0:
+                    raise AssertionError(
+                        "Market order price level at side %s" % side)
+                prev_order = None
+                level_qty = 0
+                for order in price_level:
+                    if order.side != side or order.price != price:
+                        raise AssertionError(
+                            "Order %s (side %s, price %s) is in price level "
+                            "%s at side %s" % (order.order_id, order.side,
+                                               order.price, price, side))
+                    if order.leaves_qty < 1e-9:
+                        raise AssertionError(
+                            "Order %s has no leaves qty" % order.order_id)
+                    if abs(order.cum_qty + order.leaves_qty - order.qty) \
+                            >= 1e-9:
+                        raise AssertionError(
+                            "Order %s qty %s is not the sum of cum qty %s "
+                            "and leaves qty %s" % (
+                                order.order_id, order.qty, order.cum_qty,
+                                order.leaves_qty))
+                    if prev_order is not None and \
+                            prev_order.order_id >= order.order_id:
+                        raise AssertionError(
+                            "Order %s is queued after order %s at price %s"
+                            % (order.order_id, prev_order.order_id, price))
+                    if self.order_id_map.get(order.order_id) is not order:
+                        raise AssertionError(
+                            "Order %s is not in the order id map"
+                            % order.order_id)
+                    level_qty += order.leaves_qty
+                    prev_order = order
+
+                if level_qty < 1e-9:
+                    raise AssertionError(
+                        "Price level %s at side %s has no quantity"
+                        % (price, side))
+                num_orders += len(price_level)
+
+        if num_orders != len(self.order_id_map):
+            raise AssertionError(
+                "Order id map has %d orders but the price levels have %d" % (
+                    len(self.order_id_map), num_orders))
+
+        if len(self.bids) > 0 and len(self.asks) > 0 and \
+                max(self.bids.keys()) >= min(self.asks.keys()):
+            raise AssertionError(
+                "Crossed book with best bid %s and best ask %s" % (
+                    max(self.bids.keys()), min(self.asks.keys())))
+
 
 cdef class Trade:
     cdef public int order_id
@@ -59,44 +247,533 @@ cdef class Trade:
         self.trade_side = trade_side
         self.trade_id = trade_id
 
+    def __reduce__(self):
+        return (Trade, (self.order_id, self.instmt, self.trade_price,
+                        self.trade_qty, self.trade_side, self.trade_id))
+
+
+cdef class ExecutionReport:
+    cdef public long long seq_no
+    cdef public ExecType exec_type
+    cdef public int order_id
+    cdef public str instmt
+    cdef public double price
+    cdef public double qty
+    cdef public int side
+    cdef public double cum_qty
+    cdef public double leaves_qty
+    cdef public int trade_id
+    cdef public double trade_price
+    cdef public double trade_qty
+
+    def __init__(self, exec_type, order_id, instmt, price, qty, side,
+                 cum_qty, leaves_qty, trade_id=0, trade_price=0,
+                 trade_qty=0, seq_no=0):
+        """
+        Constructor
+        :param side     1 for BUY, 2 for SELL, 0 if unknown (rejection)
+        :param seq_no   Sequence number, assigned on publish
+        """
+        self.seq_no = seq_no
+        self.exec_type = exec_type
+        self.order_id = order_id
+        self.instmt = instmt
+        self.price = price
+        self.qty = qty
+        self.side = side
+        self.cum_qty = cum_qty
+        self.leaves_qty = leaves_qty
+        self.trade_id = trade_id
+        self.trade_price = trade_price
+        self.trade_qty = trade_qty
+
+    def __reduce__(self):
+        return (ExecutionReport,
+                (self.exec_type, self.order_id, self.instmt, self.price,
+                 self.qty, self.side, self.cum_qty, self.leaves_qty,
+                 self.trade_id, self.trade_price, self.trade_qty,
+                 self.seq_no))
+
+
+cdef class EventBuffer:
+    cdef public long long seq_no
+
+    cdef long long write(self, ExecType exec_type, int order_id, str instmt,
+                         double price, double qty, int side, double cum_qty,
+                         double leaves_qty, int trade_id, double trade_price,
+                         double trade_qty) except -1:
+        """
+        Publish an execution report
+        The base buffer only assigns the sequence number and discards the
+        report, so the engine can count the reports without keeping them.
+        :return The sequence number assigned to the report
+        """
+        self.seq_no += 1
+        return self.seq_no
+
+
+cdef class EventRingBuffer(EventBuffer):
+    cdef public int capacity
+    cdef public long long read_seq_no
+    cdef public long long dropped
+    cdef long long mask
+    cdef list events
+
+    def __init__(self, int capacity=65536):
+        """
+        Constructor
+
+        Single producer, single consumer ring buffer of execution reports.
+        The producer never waits for the consumer. If the consumer lags
+        behind by more than the capacity, the oldest reports are
+        overwritten and the consumer sees a gap in the sequence numbers.
+        :param capacity     Number of reports kept, rounded up to a power
+                            of two
+        """
+        assert capacity > 0, "Invalid capacity %s" % capacity
+        self.capacity = 1
+        while self.capacity < capacity:
+            self.capacity <<= 1
+        self.mask = self.capacity - 1
+        self.seq_no = 0
+        self.read_seq_no = 0
+        self.dropped = 0
+        self.events = [None] * self.capacity
+
+    def __len__(self):
+        return min(self.seq_no - self.read_seq_no, self.capacity)
+
+    cdef long long write(self, ExecType exec_type, int order_id, str instmt,
+                         double price, double qty, int side, double cum_qty,
+                         double leaves_qty, int trade_id, double trade_price,
+                         double trade_qty) except -1:
+        return self.publish(ExecutionReport(
+            exec_type, order_id, instmt, price, qty, side, cum_qty,
+            leaves_qty, trade_id, trade_price, trade_qty))
+
+    cpdef long long publish(self, ExecutionReport report):
+        """
+        Publish a report
+        :param report       Execution report
+        :return The sequence number assigned to the report
+        """
+        self.seq_no += 1
+        report.seq_no = self.seq_no
+        self.events[(self.seq_no - 1) & self.mask] = report
+        return self.seq_no
+
+    cpdef list poll(self, int max_count=0):
+        """
+        Consume the published reports
+        :param max_count    Maximum number of reports returned, zero if
+                            unlimited
+        :return The list of reports in sequence number order
+        """
+        cdef long long start = self.read_seq_no
+        cdef long long end = self.seq_no
+        cdef long long seq_no
+        cdef list reports
+
+        if end - start > self.capacity:
+            # The producer has lapped the consumer
+            self.dropped += end - start - self.capacity
+            start = end - self.capacity
+
+        if max_count > 0 and end - start > max_count:
+            end = start + max_count
+
+        reports = [self.events[seq_no & self.mask]
+                   for seq_no in range(start, end)]
+        self.read_seq_no = end
+        return reports
+
+
+cdef packed struct SharedMemoryHeader:
+    int64_t capacity
+    int64_t seq_no
+
+
+cdef packed struct SharedMemoryRecord:
+    int64_t seq_no
+    int64_t order_id
+    int64_t trade_id
+    uint8_t exec_type
+    uint8_t side
+    char padding[6]
+    char instmt[32]
+    double price
+    double qty
+    double cum_qty
+    double leaves_qty
+    double trade_price
+    double trade_qty
+
+
+# Little endian layouts of SharedMemoryHeader and SharedMemoryRecord, to be
+# unpacked by struct
+SHARED_MEMORY_HEADER_FORMAT = '<qq'
+SHARED_MEMORY_RECORD_FORMAT = '<qqqBB6x32sdddddd'
+
+
+cdef class SharedMemoryRingBuffer(EventBuffer):
+    cdef public str path
+    cdef public long long capacity
+    cdef object file
+    cdef object buffer
+    cdef unsigned char[::1] view
+    cdef SharedMemoryHeader* header
+    cdef SharedMemoryRecord* records
+    cdef str last_instmt
+    cdef bytes last_instmt_name
+
+    def __init__(self, str path, long long capacity=65536):
+        """
+        Constructor
+
+        Ring buffer of fixed size execution report records in a memory
+        mapped file, written by the engine without creating any Python
+        object, and read by SharedMemoryReader in other processes. The
+        file starts with the capacity and the last sequence number,
+        followed by the records. Each record is written as a seqlock, i.e.
+        its sequence number is zeroed before the record is overwritten and
+        set after, so the readers can discard the torn records. The
+        instrument name is truncated to 32 bytes.
+        :param path         File path, created or truncated
+        :param capacity     Number of records kept
+        """
+        assert capacity > 0, "Invalid capacity %s" % capacity
+        size = (sizeof(SharedMemoryHeader) +
+                sizeof(SharedMemoryRecord) * capacity)
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        self.path = path
+        self.capacity = capacity
+        self.file = open(path, 'r+b')
+        self.buffer = mmap.mmap(self.file.fileno(), size)
+        self.view = self.buffer
+        self.header = <SharedMemoryHeader*> &self.view[0]
+        self.records = <SharedMemoryRecord*> &self.view[sizeof(SharedMemoryHeader)]
+        self.header.capacity = capacity
+        self.header.seq_no = 0
+        self.seq_no = 0
+
+    cdef long long write(self, ExecType exec_type, int order_id, str instmt,
+                         double price, double qty, int side, double cum_qty,
+                         double leaves_qty, int trade_id, double trade_price,
+                         double trade_qty) except -1:
+        cdef SharedMemoryRecord* record
+        cdef Py_ssize_t name_len
+
+        if self.header == NULL:
+            raise ValueError("The shared memory ring buffer %s is closed"
+                             % self.path)
+
+        if instmt is not self.last_instmt:
+            self.last_instmt = instmt
+            self.last_instmt_name = instmt.encode('utf-8')[:32]
+        name_len = len(self.last_instmt_name)
+
+        self.seq_no += 1
+        record = self.records + (self.seq_no - 1) % self.capacity
+
+        # Invalidate the record before overwriting it
+        record.seq_no = 0
+        lme_memory_barrier()
+
+        record.order_id = order_id
+        record.trade_id = trade_id
+        record.exec_type = exec_type
+        record.side = side
+        memset(record.instmt, 0, 32)
+        memcpy(record.instmt, <const char*> self.last_instmt_name, name_len)
+        record.price = price
+        record.qty = qty
+        record.cum_qty = cum_qty
+        record.leaves_qty = leaves_qty
+        record.trade_price = trade_price
+        record.trade_qty = trade_qty
+
+        # Publish the record after it is written
+        lme_memory_barrier()
+        record.seq_no = self.seq_no
+        lme_memory_barrier()
+        self.header.seq_no = self.seq_no
+        return self.seq_no
+
+    def close(self):
+        """
+        Unmap and close the file
+        """
+        self.header = NULL
+        self.records = NULL
+        self.view = None
+        self.buffer.close()
+        self.file.close()
+
+
+cdef class TimerWheel:
+    cdef public long long current_time
+    cdef public int slot_bits
+    cdef public int num_levels
+    cdef long long slot_mask
+    cdef list levels
+    cdef list level_counts
+    cdef list due
+
+    def __init__(self, long long current_time=0, int slot_bits=8):
+        """
+        Constructor
+        :param current_time     Initial time of the wheel
+        :param slot_bits        Number of bits per level, i.e. each level
+                                has 2 ** slot_bits slots. The number of
+                                levels is chosen to cover the whole
+                                non-negative 64-bit time range.
+        """
+        assert current_time >= 0, "Invalid current time %s" % current_time
+        assert 0 < slot_bits < 63, "Invalid slot bits %s" % slot_bits
+        self.current_time = current_time
+        self.slot_bits = slot_bits
+        self.num_levels = (63 + slot_bits - 1) // slot_bits
+        self.slot_mask = (1 << slot_bits) - 1
+        self.levels = [[[] for _ in range(1 << slot_bits)]
+                       for _ in range(self.num_levels)]
+        self.level_counts = [0] * self.num_levels
+        self.due = []
+
+    def __len__(self):
+        return sum(self.level_counts) + len(self.due)
+
+    def __reduce__(self):
+        return (TimerWheel, (self.current_time, self.slot_bits),
+                (self.levels, self.level_counts, self.due))
+
+    def __setstate__(self, state):
+        self.levels, self.level_counts, self.due = state
+
+    cpdef TimerWheel clone(self):
+        """
+        Clone the wheel. The scheduled items are shared.
+        :return The cloned wheel
+        """
+        cdef TimerWheel wheel = TimerWheel.__new__(TimerWheel)
+        wheel.current_time = self.current_time
+        wheel.slot_bits = self.slot_bits
+        wheel.num_levels = self.num_levels
+        wheel.slot_mask = self.slot_mask
+        wheel.levels = [[list(slot) for slot in level] for level in self.levels]
+        wheel.level_counts = list(self.level_counts)
+        wheel.due = list(self.due)
+        return wheel
+
+    cpdef add(self, long long expire_time, object item):
+        """
+        Schedule an item
+        :param expire_time      Time at which the item is due
+        :param item             Item returned by advance once it is due
+        """
+        cdef int level
+        cdef int shift
+
+        if expire_time <= self.current_time:
+            self.due.append((expire_time, item))
+            return
+
+        # Place the item on the lowest level which shares all the higher
+        # digits with the current time
+        for level in range(self.num_levels):
+            shift = self.slot_bits * (level + 1)
+            if level == self.num_levels - 1 or \
+               (expire_time >> shift) == (self.current_time >> shift):
+                shift -= self.slot_bits
+                self.levels[level][(expire_time >> shift) & self.slot_mask] \
+                    .append((expire_time, item))
+                self.level_counts[level] += 1
+                return
+
+    cpdef list advance(self, long long current_time):
+        """
+        Advance the wheel
+        :param current_time     New time of the wheel
+        :return The list of items which are due, in no particular order.
+                The cost is proportional to the number of due items and
+                visited slots, but not to the elapsed time.
+        """
+        cdef list expired = []
+        cdef list entries
+        cdef int level
+        cdef int shift
+        cdef long long next_time
+        cdef long long slot
+
+        assert current_time >= self.current_time, \
+            "Cannot move the time backward from %s to %s" % (
+                self.current_time, current_time)
+
+        while True:
+            if len(self.due) > 0:
+                expired.extend([item for _, item in self.due])
+                self.due = []
+
+            # Locate the lowest occupied level
+            level = 0
+            while level < self.num_levels and self.level_counts[level] == 0:
+                level += 1
+
+            if level == self.num_levels:
+                break
+
+            # All the lower levels are empty, so jump to the next slot
+            # boundary of the occupied level
+            shift = self.slot_bits * level
+            next_time = ((self.current_time >> shift) + 1) << shift
+            if next_time > current_time:
+                break
+
+            self.current_time = next_time
+
+            # Cascade the slots of the higher levels reached by the time
+            for level in range(self.num_levels - 1, 0, -1):
+                shift = self.slot_bits * level
+                if next_time & ((1 << shift) - 1) != 0:
+                    continue
+
+                slot = (next_time >> shift) & self.slot_mask
+                entries = self.levels[level][slot]
+                if len(entries) > 0:
+                    self.levels[level][slot] = []
+                    self.level_counts[level] -= len(entries)
+                    for expire_time, item in entries:
+                        self.add(expire_time, item)
+
+            # Expire the level zero slot
+            slot = next_time & self.slot_mask
+            entries = self.levels[0][slot]
+            if len(entries) > 0:
+                self.levels[0][slot] = []
+                self.level_counts[0] -= len(entries)
+                expired.extend([item for _, item in entries])
+
+        self.current_time = current_time
+        return expired
+
 
 cdef class LightMatchingEngine:
     cdef public dict order_books
     cdef public int curr_order_id
     cdef public int curr_trade_id
+    cdef public TimerWheel timer_wheel
+    cdef public EventBuffer event_buffer
 
-    def __init__(self):
+    def __init__(self, EventBuffer event_buffer=None):
         """
         Constructor
+        :param event_buffer     EventRingBuffer or SharedMemoryRingBuffer
+                                receiving the execution reports, or
+                                EventBuffer only counting them. None if no
+                                report is published
         """
         self.order_books = {}
         self.curr_order_id = 0
         self.curr_trade_id = 0
+        self.timer_wheel = TimerWheel()
+        self.event_buffer = event_buffer
 
-    cpdef add_order(self, str instmt, double price, double qty, Side side):
+    def __reduce__(self):
+        # The event buffer is a runtime channel and is not pickled
+        return (LightMatchingEngine, (),
+                (self.order_books, self.curr_order_id, self.curr_trade_id,
+                 self.timer_wheel))
+
+    def __setstate__(self, state):
+        (self.order_books, self.curr_order_id, self.curr_trade_id,
+         self.timer_wheel) = state
+
+    cpdef LightMatchingEngine clone(self):
+        """
+        Clone the engine for simulation. The order books are copied, so
+        the orders matched in the clone do not modify this engine, and
+        vice versa. The clone does not publish execution reports.
+        :return The cloned engine
+        """
+        cdef LightMatchingEngine engine = \
+            LightMatchingEngine.__new__(LightMatchingEngine)
+        cdef OrderBook order_book
+
+        engine.order_books = {}
+        for instmt, order_book in self.order_books.items():
+            engine.order_books[instmt] = order_book.clone()
+        engine.curr_order_id = self.curr_order_id
+        engine.curr_trade_id = self.curr_trade_id
+        engine.timer_wheel = self.timer_wheel.clone()
+        return engine
+
+    cdef _publish(self, ExecType exec_type, Order order):
+        """
+        Publish an execution report of the order
+        """
+        self.event_buffer.write(
+            exec_type, order.order_id, order.instmt, order.price, order.qty,
+            order.side, order.cum_qty, order.leaves_qty, 0, 0, 0)
+
+    cdef _publish_fill(self, Order order, Trade trade):
+        """
+        Publish a fill or partial fill report of the order
+        """
+        self.event_buffer.write(
+            ExecType.FILL if order.leaves_qty < 1e-9 else ExecType.PARTIAL_FILL,
+            order.order_id, order.instmt, order.price, order.qty,
+            order.side, order.cum_qty, order.leaves_qty,
+            trade.trade_id, trade.trade_price, trade.trade_qty)
+
+    cdef _publish_reject(self, int order_id, str instmt):
+        """
+        Publish a rejection of a request on an unknown order
+        """
+        self.event_buffer.write(
+            ExecType.REJECT, order_id, instmt, 0, 0, 0, 0, 0, 0, 0, 0)
+
+    cpdef add_order(self, str instmt, double price, double qty, Side side,
+                    long long expire_time=0):
         """
         Add an order
         :param instmt       Instrument name
-        :param price        Price, defined as zero if market order
+        :param price        Price, defined as zero if market order. The
+                            remaining quantity of a market order is
+                            cancelled right after matching.
         :param qty          Order quantity
         :param side         1 for BUY, 2 for SELL. Defaulted as BUY.
+        :param expire_time  Time at which the remaining quantity expires,
+                            defined as zero if good till cancel. If it is
+                            not later than the engine time, the remaining
+                            quantity expires right after matching.
         :return The order and the list of trades.
                 Empty list if there is no matching.
         """
         cdef list trades = []
         cdef int order_id
         cdef Order order
+        cdef Order hit_order
+        cdef OrderBook order_book
+        cdef double best_price_qty
+        cdef bint expired = \
+            0 < expire_time <= self.timer_wheel.current_time
+        cdef bint is_market = price == 0.0
 
         assert side == Side.BUY or side == Side.SELL, \
                 "Invalid side %s" % side
+        assert expire_time >= 0, "Invalid expire time %s" % expire_time
 
         # Locate the order book
-        order_book = self.order_books.setdefault(instmt, OrderBook())
+        order_book = self.order_books.get(instmt)
+        if order_book is None:
+            order_book = self.order_books[instmt] = OrderBook()
 
         # Initialization
         self.curr_order_id += 1
         order_id = self.curr_order_id
-        order = Order(order_id, instmt, price, qty, side)
+        order = Order(order_id, instmt, price, qty, side, expire_time)
+        if self.event_buffer is not None:
+            self._publish(ExecType.NEW, order)
 
         if side == Side.BUY:
             # Buy
@@ -105,7 +782,12 @@ cdef class LightMatchingEngine:
             while best_price is not None and \
                   (price == 0.0 or price >= best_price ) and \
                   order.leaves_qty >= 1e-9:
-                best_price_qty = sum([ask.leaves_qty for ask in order_book.asks[best_price]])
+                # Only the quantity up to the order leaves quantity is needed
+                best_price_qty = 0
+                for hit_order in order_book.asks[best_price]:
+                    best_price_qty += hit_order.leaves_qty
+                    if best_price_qty >= order.leaves_qty:
+                        break
                 match_qty = min(best_price_qty, order.leaves_qty)
                 assert match_qty >= 1e-9, "Match quantity must be larger than zero"
 
@@ -115,6 +797,8 @@ cdef class LightMatchingEngine:
                 order.leaves_qty -= match_qty
                 trades.append(Trade(order_id, instmt, best_price, match_qty, \
                                     Side.BUY, self.curr_trade_id))
+                if self.event_buffer is not None:
+                    self._publish_fill(order, trades[-1])
 
                 # Generate the passive executions
                 while match_qty >= 1e-9:
@@ -128,9 +812,12 @@ cdef class LightMatchingEngine:
                                         Side.SELL, self.curr_trade_id))
                     hit_order.cum_qty += order_match_qty
                     hit_order.leaves_qty -= order_match_qty
+                    if self.event_buffer is not None:
+                        self._publish_fill(hit_order, trades[-1])
                     match_qty -= order_match_qty
                     if hit_order.leaves_qty < 1e-9:
                         del order_book.asks[best_price][0]
+                        del order_book.order_id_map[hit_order.order_id]
 
                 # If the price does not have orders, delete the particular price depth
                 if len(order_book.asks[best_price]) == 0:
@@ -141,10 +828,12 @@ cdef class LightMatchingEngine:
                                 else None
 
             # Add the remaining order into the depth
-            if order.leaves_qty >= 1e-9:
+            if order.leaves_qty >= 1e-9 and not expired and not is_market:
                 depth = order_book.bids.setdefault(price, [])
                 depth.append(order)
                 order_book.order_id_map[order_id] = order
+                if expire_time > 0:
+                    self.timer_wheel.add(expire_time, order)
         else:
             #Sell
             best_price = max(order_book.bids.keys()) if len(order_book.bids) > 0 \
@@ -152,7 +841,12 @@ cdef class LightMatchingEngine:
             while best_price is not None and \
                   (price == 0.0 or price <= best_price) and \
                   order.leaves_qty >= 1e-9:
-                best_price_qty = sum([bid.leaves_qty for bid in order_book.bids[best_price]])
+                # Only the quantity up to the order leaves quantity is needed
+                best_price_qty = 0
+                for hit_order in order_book.bids[best_price]:
+                    best_price_qty += hit_order.leaves_qty
+                    if best_price_qty >= order.leaves_qty:
+                        break
                 match_qty = min(best_price_qty, order.leaves_qty)
                 assert match_qty >= 1e-9, "Match quantity must be larger than zero"
 
@@ -162,6 +856,8 @@ cdef class LightMatchingEngine:
                 order.leaves_qty -= match_qty
                 trades.append(Trade(order_id, instmt, best_price, match_qty, \
                                     Side.SELL, self.curr_trade_id))
+                if self.event_buffer is not None:
+                    self._publish_fill(order, trades[-1])
 
                 # Generate the passive executions
                 while match_qty >= 1e-9:
@@ -175,9 +871,12 @@ cdef class LightMatchingEngine:
                                         Side.BUY, self.curr_trade_id))
                     hit_order.cum_qty += order_match_qty
                     hit_order.leaves_qty -= order_match_qty
+                    if self.event_buffer is not None:
+                        self._publish_fill(hit_order, trades[-1])
                     match_qty -= order_match_qty
                     if hit_order.leaves_qty < 1e-9:
                         del order_book.bids[best_price][0]
+                        del order_book.order_id_map[hit_order.order_id]
 
                 # If the price does not have orders, delete the particular price depth
                 if len(order_book.bids[best_price]) == 0:
@@ -188,10 +887,21 @@ cdef class LightMatchingEngine:
                                 else None
 
             # Add the remaining order into the depth
-            if order.leaves_qty >= 1e-9:
+            if order.leaves_qty >= 1e-9 and not expired and not is_market:
                 depth = order_book.asks.setdefault(price, [])
                 depth.append(order)
                 order_book.order_id_map[order_id] = order
+                if expire_time > 0:
+                    self.timer_wheel.add(expire_time, order)
+
+        if order.leaves_qty >= 1e-9 and (expired or is_market):
+            # The order has already expired, or is a market order without
+            # any price to rest at, so the remaining quantity is not kept
+            # in the depth
+            order.leaves_qty = 0
+            if self.event_buffer is not None:
+                self._publish(ExecType.EXPIRE if expired else ExecType.CANCEL,
+                              order)
 
         return order, trades
 
@@ -203,9 +913,11 @@ cdef class LightMatchingEngine:
         :return The order if the cancellation is successful
         """
         cdef Order order
+        cdef OrderBook order_book
         cdef double order_price
         cdef Side side
-        cdef int index
+        cdef list price_level
+        cdef Py_ssize_t index
 
         assert instmt in self.order_books.keys(), \
                 "Instrument %s is not valid in the order book" % instmt
@@ -213,6 +925,8 @@ cdef class LightMatchingEngine:
 
         if order_id not in order_book.order_id_map.keys():
             # Invalid order id
+            if self.event_buffer is not None:
+                self._publish_reject(order_id, instmt)
             return None
 
         order = order_book.order_id_map[order_id]
@@ -229,18 +943,15 @@ cdef class LightMatchingEngine:
                  "Order price %.6f is not in the ask price depth" % order_price
             price_level = order_book.asks[order_price]
 
-        index = 0
-        price_level_len = len(price_level)
-        while index < price_level_len:
-            if price_level[index].order_id == order_id:
-                del price_level[index]
-                break
-            index += 1
-
-        if index == price_level_len:
+        index = find_order_index(price_level, order)
+        if index < 0:
             # Cannot find the order ID. Incorrect side
+            if self.event_buffer is not None:
+                self._publish_reject(order_id, instmt)
             return None
 
+        del price_level[index]
+
         if side == Side.BUY and len(order_book.bids[order_price]) == 0:
             # Delete empty particular price level
             del order_book.bids[order_price]
@@ -254,6 +965,9 @@ cdef class LightMatchingEngine:
         # Zero out leaves qty
         order.leaves_qty = 0
 
+        if self.event_buffer is not None:
+            self._publish(ExecType.CANCEL, order)
+
         return order
 
     cpdef amend_order(self, int order_id, str instmt, double amended_price,
@@ -268,6 +982,7 @@ cdef class LightMatchingEngine:
                 Empty list if there is no matching.
         """
         cdef Order order
+        cdef OrderBook order_book
         cdef double order_price
         cdef Side side
         cdef int index
@@ -278,6 +993,8 @@ cdef class LightMatchingEngine:
 
         if order_id not in order_book.order_id_map.keys():
             # Invalid order id
+            if self.event_buffer is not None:
+                self._publish_reject(order_id, instmt)
             return None
 
         order = order_book.order_id_map[order_id]
@@ -295,10 +1012,14 @@ cdef class LightMatchingEngine:
             order.leaves_qty -= (order.qty - amended_qty)
             order.qty = amended_qty
 
+            if self.event_buffer is not None:
+                self._publish(ExecType.AMEND, order)
+
             # Return amended order without any trades
             return order, []
 
-        # Otherwise cancel the order and add a new order
+        # Otherwise cancel the order and add a new order. The execution
+        # reports are published as a cancel and a new order accordingly.
         old_order = self.cancel_order(order_id=order_id, instmt=instmt)
 
         assert old_order is not None, (
@@ -309,5 +1030,320 @@ cdef class LightMatchingEngine:
             instmt=instmt,
             price=amended_price,
             qty=amended_qty,
-            side=order.side
+            side=order.side,
+            expire_time=order.expire_time
         )
+
+    cpdef list cancel_all_orders(self, str instmt):
+        """
+        Cancel all the orders of an instrument
+        :param instmt       Instrument
+        :return The list of cancelled orders
+        """
+        cdef list orders
+        cdef Order order
+        cdef OrderBook order_book
+
+        assert instmt in self.order_books.keys(), \
+                "Instrument %s is not valid in the order book" % instmt
+        order_book = self.order_books[instmt]
+
+        orders = [order for order in order_book.order_id_map.values()
+                  if order.leaves_qty >= 1e-9]
+        for order in orders:
+            # Zero out leaves qty
+            order.leaves_qty = 0
+            if self.event_buffer is not None:
+                self._publish(ExecType.CANCEL, order)
+
+        # Drop the whole depth instead of removing the orders one by one
+        order_book.bids = {}
+        order_book.asks = {}
+        order_book.order_id_map = {}
+
+        return orders
+
+    cpdef list advance_time(self, long long current_time):
+        """
+        Advance the engine time and expire the due orders
+        The due orders are found in the timer wheel without scanning the
+        resting orders, and removed from their price levels by binary
+        search, i.e. the cost is proportional to the expired orders. A
+        price level is rebuilt in one pass instead if a large share of it
+        expires at once.
+        :param current_time     Current time, in the same unit as the
+                                order expire time
+        :return The list of expired orders
+        """
+        cdef list expired_orders = []
+        cdef list price_level
+        cdef list level_orders
+        cdef dict price_levels = {}
+        cdef Order scheduled_order
+        cdef Order order
+        cdef OrderBook order_book
+        cdef Py_ssize_t index
+
+        for scheduled_order in self.timer_wheel.advance(current_time):
+            # The scheduled order may be the one of the engine this engine
+            # is cloned from, so locate the order in its own book
+            order_book = self.order_books[scheduled_order.instmt]
+            order = order_book.order_id_map.pop(scheduled_order.order_id, None)
+            if order is None:
+                # The order is already filled, cancelled or amended
+                continue
+
+            order.leaves_qty = 0
+            expired_orders.append(order)
+            if self.event_buffer is not None:
+                self._publish(ExecType.EXPIRE, order)
+            price_levels.setdefault(
+                (order.instmt, order.side, order.price), []).append(order)
+
+        # Remove the expired orders level by level
+        for (instmt, side, price), level_orders in price_levels.items():
+            order_book = self.order_books[instmt]
+            depth = order_book.bids if side == Side.BUY else order_book.asks
+            price_level = depth[price]
+            if len(level_orders) * 8 >= len(price_level):
+                price_level = [o for o in price_level if o.leaves_qty >= 1e-9]
+                depth[price] = price_level
+            else:
+                for order in level_orders:
+                    index = find_order_index(price_level, order)
+                    assert index >= 0, \
+                        "Order %s is not in its price level" % order.order_id
+                    del price_level[index]
+
+            if len(price_level) == 0:
+                del depth[price]
+
+        return expired_orders
+
+
+cdef packed struct ReplayRecord:
+    int64_t timestamp
+    int64_t order_id
+    double price
+    double qty
+    uint8_t msg_type
+    uint8_t side
+
+
+cpdef enum ReplayMsgType:
+    REPLAY_ADD = 65     # A
+    REPLAY_CANCEL = 88  # X
+    REPLAY_AMEND = 77   # M
+
+
+# Little endian layout of ReplayRecord, to be packed by struct
+REPLAY_RECORD_FORMAT = '<qqddBB'
+
+
+def csv_to_replay_file(str csv_path, str replay_path):
+    """
+    Convert an order by order CSV file into the binary replay format
+    :param csv_path     CSV file with the header
+                        timestamp,msg_type,order_id,side,price,qty
+                        where msg_type is A (add), X (cancel) or M (amend)
+                        and side is B or S
+    :param replay_path  Binary replay file path
+    :return Number of records written
+    """
+    record = struct.Struct(REPLAY_RECORD_FORMAT)
+    num_records = 0
+    with open(csv_path) as csv_file, open(replay_path, 'wb') as replay_file:
+        for row in csv.DictReader(csv_file):
+            replay_file.write(record.pack(
+                int(row['timestamp']), int(row['order_id']),
+                float(row['price'] or 0), float(row['qty'] or 0),
+                ord(row['msg_type']),
+                Side.BUY if row['side'] == 'B' else Side.SELL))
+            num_records += 1
+
+    return num_records
+
+
+cdef class Replayer:
+    cdef public LightMatchingEngine engine
+    cdef public str instmt
+    cdef public dict order_id_map
+    cdef public dict filled_qty_map
+    cdef public long long num_messages
+    cdef public object sampler
+    cdef public long long sample_interval
+
+    def __init__(self, LightMatchingEngine engine, str instmt, sampler=None,
+                 long long sample_interval=0):
+        """
+        Constructor
+
+        Rebuild the order book of an instrument from an order by order
+        feed. The external order ids of the feed are mapped to the engine
+        order ids. An amend replacing a partly filled order keeps the
+        filled quantity in the filled qty map, as the amend quantities of
+        the feed include it.
+        :param engine           Matching engine
+        :param instmt           Instrument name
+        :param sampler          Callable taking the message timestamp and
+                                the order book, called every sample
+                                interval messages
+        :param sample_interval  Number of messages between the samples,
+                                zero if not sampled
+        """
+        assert sample_interval >= 0, \
+                "Invalid sample interval %s" % sample_interval
+        assert sample_interval == 0 or sampler is not None, \
+                "Invalid sampler None with sample interval %s" % sample_interval
+        self.engine = engine
+        self.instmt = instmt
+        self.order_id_map = {}
+        self.filled_qty_map = {}
+        self.num_messages = 0
+        self.sampler = sampler
+        self.sample_interval = sample_interval
+
+    cdef _process(self, int msg_type, int64_t order_id, Side side,
+                  double price, double qty, int64_t timestamp):
+        """
+        Process a message
+        """
+        cdef Order order
+        cdef OrderBook order_book
+        cdef double carried_qty
+        cdef double filled_qty
+
+        if msg_type == REPLAY_ADD:
+            order, _ = self.engine.add_order(self.instmt, price, qty, side)
+            if order.leaves_qty >= 1e-9:
+                self.order_id_map[order_id] = order.order_id
+        elif msg_type == REPLAY_CANCEL or msg_type == REPLAY_AMEND:
+            engine_order_id = self.order_id_map.pop(order_id, None)
+            carried_qty = self.filled_qty_map.pop(order_id, 0.0)
+            order_book = self.engine.order_books.get(self.instmt)
+            if engine_order_id is not None:
+                order = order_book.order_id_map.get(engine_order_id)
+            else:
+                order = None
+
+            # Ignore the orders already filled in the engine
+            if order is not None and order.leaves_qty >= 1e-9:
+                # The amended quantity is the total order quantity, including
+                # the quantity filled by the orders replaced before
+                filled_qty = carried_qty + order.cum_qty
+                if msg_type == REPLAY_CANCEL or qty - filled_qty < 1e-9:
+                    # An order already filled up to it is cancelled
+                    self.engine.cancel_order(order.order_id, self.instmt)
+                else:
+                    if abs(order.price - price) < 1e-9 and \
+                       qty - carried_qty <= order.qty:
+                        # Reduce the quantity in place
+                        order, _ = self.engine.amend_order(
+                            order.order_id, self.instmt, price,
+                            qty - carried_qty)
+                    else:
+                        # Replace the order by one of the remaining
+                        # quantity, so the filled quantity does not rest
+                        # again
+                        self.engine.cancel_order(order.order_id, self.instmt)
+                        order, _ = self.engine.add_order(
+                            self.instmt, price, qty - filled_qty,
+                            order.side, order.expire_time)
+                        carried_qty = filled_qty
+                    if order.leaves_qty >= 1e-9:
+                        self.order_id_map[order_id] = order.order_id
+                        if carried_qty >= 1e-9:
+                            self.filled_qty_map[order_id] = carried_qty
+        else:
+            raise ValueError("Invalid message type %s" % msg_type)
+
+        self.num_messages += 1
+        if self.sample_interval > 0 and \
+           self.num_messages % self.sample_interval == 0:
+            self.sampler(timestamp, self.engine.order_books.get(self.instmt))
+
+    cpdef long long replay_buffer(self, const unsigned char[:] buffer):
+        """
+        Replay the binary records in a buffer
+        :param buffer       Buffer of packed ReplayRecord
+        :return Number of records replayed
+        """
+        cdef Py_ssize_t record_size = sizeof(ReplayRecord)
+        cdef Py_ssize_t num_records = buffer.shape[0] // record_size
+        cdef Py_ssize_t i
+        cdef const ReplayRecord* record
+
+        assert buffer.shape[0] % record_size == 0, \
+                "Buffer size %d is not a multiple of the record size %d" % (
+                    buffer.shape[0], record_size)
+
+        for i in range(num_records):
+            record = <const ReplayRecord*> &buffer[i * record_size]
+            self._process(record.msg_type, record.order_id,
+                          <Side> record.side, record.price, record.qty,
+                          record.timestamp)
+
+        return num_records
+
+    def replay_file(self, str path, long long chunk_records=1 << 20):
+        """
+        Replay a binary replay file, memory mapped chunk by chunk
+        :param path             Binary replay file path
+        :param chunk_records    Number of records mapped per chunk
+        :return Number of records replayed
+        """
+        cdef long long record_size = sizeof(ReplayRecord)
+        cdef long long num_records
+        cdef long long start = 0
+        cdef long long end
+        cdef long long offset
+
+        with open(path, 'rb') as replay_file:
+            file_size = os.fstat(replay_file.fileno()).st_size
+            assert file_size % record_size == 0, \
+                    "File size %d is not a multiple of the record size %d" % (
+                        file_size, record_size)
+            num_records = file_size // record_size
+
+            while start < num_records:
+                end = min(start + chunk_records, num_records)
+                # The mapping offset must be aligned to the granularity
+                offset = (start * record_size //
+                          mmap.ALLOCATIONGRANULARITY *
+                          mmap.ALLOCATIONGRANULARITY)
+                buffer = mmap.mmap(replay_file.fileno(),
+                                   end * record_size - offset,
+                                   access=mmap.ACCESS_READ, offset=offset)
+                view = memoryview(buffer)
+                chunk = view[start * record_size - offset:]
+                try:
+                    self.replay_buffer(chunk)
+                finally:
+                    chunk.release()
+                    view.release()
+                    buffer.close()
+
+                start = end
+
+        return num_records
+
+    def replay_csv(self, str path):
+        """
+        Replay an order by order CSV file, see csv_to_replay_file for the
+        format. Prefer converting the file once into the binary format
+        for repeated replays.
+        :param path     CSV file path
+        :return Number of records replayed
+        """
+        cdef long long num_records = 0
+
+        with open(path) as csv_file:
+            for row in csv.DictReader(csv_file):
+                self._process(
+                    ord(row['msg_type']), int(row['order_id']),
+                    Side.BUY if row['side'] == 'B' else Side.SELL,
+                    float(row['price'] or 0), float(row['qty'] or 0),
+                    int(row['timestamp']))
+                num_records += 1
+
+        return num_records
@@ -0,0 +1,212 @@
+#!/usr/bin/python3
+"""
+Consumers of the execution reports published by the matching engine.
+
+The engine publishes the reports into an EventRingBuffer on the matching
+thread. An EventDrainer polls the buffer on its own thread and hands the
+reports over to the sinks. The drainer and the sinks run in the engine
+process and share the interpreter lock with the matching, so they take
+time from it.
+
+Consumers which must not slow down the matching read a
+SharedMemoryRingBuffer, written by the engine at the C level, with a
+SharedMemoryReader in another process.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+
+from lightmatchingengine.lightmatchingengine import (
+    ExecutionReport, SHARED_MEMORY_HEADER_FORMAT, SHARED_MEMORY_RECORD_FORMAT)
+
+
+class EventSink(object):
+    """
+    Base class of the execution report sinks
+    """
+    def on_reports(self, reports):
+        """
+        Handle a batch of reports
+        :param reports      List of execution reports in sequence order
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release the resources of the sink
+        """
+        pass
+
+
+class QueueSink(EventSink):
+    """
+    Put the reports into a queue, e.g. queue.Queue for another thread or
+    multiprocessing.Queue for another process
+    """
+    def __init__(self, queue):
+        """
+        Constructor
+        :param queue        Queue object with a put method
+        """
+        self.queue = queue
+
+    def on_reports(self, reports):
+        for report in reports:
+            self.queue.put(report)
+
+
+class FileSink(EventSink):
+    """
+    Append the reports to a comma separated file
+    """
+    FIELDS = ['seq_no', 'exec_type', 'order_id', 'instmt', 'price', 'qty',
+              'side', 'cum_qty', 'leaves_qty', 'trade_id', 'trade_price',
+              'trade_qty']
+
+    def __init__(self, path):
+        """
+        Constructor
+        :param path         File path. The header is written if the file
+                            is new.
+        """
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a')
+        if is_new:
+            self.file.write(','.join(FileSink.FIELDS) + '\n')
+
+    def on_reports(self, reports):
+        self.file.write(''.join([
+            '%d,%d,%d,%s,%r,%r,%d,%r,%r,%d,%r,%r\n' % (
+                report.seq_no, report.exec_type, report.order_id,
+                report.instmt, report.price, report.qty, report.side,
+                report.cum_qty, report.leaves_qty, report.trade_id,
+                report.trade_price, report.trade_qty)
+            for report in reports]))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class SharedMemoryReader(object):
+    """
+    Read the reports written by a SharedMemoryRingBuffer, usually in
+    another process than the engine
+    """
+    HEADER = struct.Struct(SHARED_MEMORY_HEADER_FORMAT)
+    RECORD = struct.Struct(SHARED_MEMORY_RECORD_FORMAT)
+    SEQ_NO = struct.Struct('<q')
+
+    def __init__(self, path):
+        """
+        Constructor
+        :param path         File path of the ring buffer
+        """
+        self.file = open(path, 'rb')
+        self.buffer = mmap.mmap(self.file.fileno(), 0,
+                                access=mmap.ACCESS_READ)
+        self.capacity, _ = SharedMemoryReader.HEADER.unpack_from(
+            self.buffer, 0)
+        self.read_seq_no = 0
+        self.dropped = 0
+
+    def poll(self):
+        """
+        Read the new reports
+        :return The list of reports in sequence order. The reports
+                overwritten before or while being read are counted in
+                dropped.
+        """
+        reports = []
+        _, seq_no = SharedMemoryReader.HEADER.unpack_from(self.buffer, 0)
+        start = max(self.read_seq_no, seq_no - self.capacity) + 1
+        self.dropped += start - self.read_seq_no - 1
+
+        for expected_seq_no in range(start, seq_no + 1):
+            offset = (SharedMemoryReader.HEADER.size +
+                      SharedMemoryReader.RECORD.size *
+                      ((expected_seq_no - 1) % self.capacity))
+
+            # The record is valid only if its sequence number is the
+            # expected one both before and after copying it, otherwise the
+            # writer has overwritten it in the meantime
+            record = None
+            if SharedMemoryReader.SEQ_NO.unpack_from(
+                    self.buffer, offset)[0] == expected_seq_no:
+                record = SharedMemoryReader.RECORD.unpack_from(
+                    self.buffer, offset)
+                if SharedMemoryReader.SEQ_NO.unpack_from(
+                        self.buffer, offset)[0] != expected_seq_no:
+                    record = None
+
+            if record is None:
+                self.dropped += 1
+                continue
+
+            (record_seq_no, order_id, trade_id, exec_type, side, instmt,
+             price, qty, cum_qty, leaves_qty, trade_price, trade_qty) = record
+            reports.append(ExecutionReport(
+                exec_type, order_id, instmt.rstrip(b'\0').decode('utf-8'),
+                price, qty, side, cum_qty, leaves_qty, trade_id,
+                trade_price, trade_qty, record_seq_no))
+
+        self.read_seq_no = seq_no
+        return reports
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+
+class EventDrainer(threading.Thread):
+    """
+    Thread draining an event ring buffer into the sinks
+    """
+    def __init__(self, event_buffer, sinks, batch_size=4096,
+                 idle_sleep=0.001):
+        """
+        Constructor
+        :param event_buffer     EventRingBuffer of the engine
+        :param sinks            List of EventSink
+        :param batch_size       Maximum number of reports per poll
+        :param idle_sleep       Seconds to sleep if no report is polled
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.event_buffer = event_buffer
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.idle_sleep = idle_sleep
+        self.stop_event = threading.Event()
+
+    def drain(self):
+        """
+        Dispatch the pending reports to the sinks
+        :return Number of reports dispatched
+        """
+        reports = self.event_buffer.poll(self.batch_size)
+        if len(reports) > 0:
+            for sink in self.sinks:
+                sink.on_reports(reports)
+        return len(reports)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.drain() == 0:
+                time.sleep(self.idle_sleep)
+
+        # Flush the remaining reports
+        while self.drain() > 0:
+            pass
+
+    def stop(self):
+        """
+        Stop the thread after flushing the remaining reports and close
+        the sinks
+        """
+        self.stop_event.set()
+        self.join()
+        for sink in self.sinks:
+            sink.close()
@@ -306,6 +306,37 @@ class TestBasicOrders(unittest.TestCase):
             self.check_trade(trades[2*i+1], 10-i, buy_order.instmt, \
                              match_price, TestBasicOrders.lot_size, buy_order.side, 2*i+2)
 
+    def test_market_order_remaining_qty(self):
+        me = lme.LightMatchingEngine(lme.EventRingBuffer())
+
+        # Place a buy order
+        buy_order, trades = me.add_order(TestBasicOrders.instmt, \
+                                         TestBasicOrders.price, \
+                                         TestBasicOrders.lot_size, \
+                                         lme.Side.BUY)
+
+        # Place a market sell order larger than the depth
+        sell_order, trades = me.add_order(TestBasicOrders.instmt, \
+                                          0, \
+                                          3 * TestBasicOrders.lot_size, \
+                                          lme.Side.SELL)
+        self.assertEqual(2, len(trades))
+        self.check_order(sell_order, 2, TestBasicOrders.instmt, 0, \
+                         3 * TestBasicOrders.lot_size, lme.Side.SELL, \
+                         TestBasicOrders.lot_size, 0)
+        self.check_order_book(me, TestBasicOrders.instmt, 0, 0)
+        self.assertFalse(2 in me.order_books[TestBasicOrders.instmt].order_id_map)
+        self.assertEqual(lme.ExecType.CANCEL, me.event_buffer.poll()[-1].exec_type)
+
+        # A later buy order does not trade at the zero price
+        buy_order, trades = me.add_order(TestBasicOrders.instmt, \
+                                         TestBasicOrders.price - 1, \
+                                         TestBasicOrders.lot_size, \
+                                         lme.Side.BUY)
+        self.assertEqual(0, len(trades))
+        self.check_order_book(me, TestBasicOrders.instmt, 1, 0)
+        me.order_books[TestBasicOrders.instmt].validate()
+
     def test_amend_qty_down(self):
         me = lme.LightMatchingEngine()
 
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+import lightmatchingengine.lightmatchingengine as lme
+import pickle
+import unittest
+
+class TestClone(unittest.TestCase):
+    instmt = "TestingInstrument"
+    price = 100.0
+    lot_size = 1.0
+
+    def create_engine(self):
+        """
+        Create an engine with five bid and ask levels of two orders each
+        """
+        me = lme.LightMatchingEngine()
+        for i in range(1, 6):
+            for _ in range(2):
+                me.add_order(TestClone.instmt, TestClone.price - i,
+                             TestClone.lot_size, lme.Side.BUY,
+                             expire_time=100)
+                me.add_order(TestClone.instmt, TestClone.price + i,
+                             TestClone.lot_size, lme.Side.SELL)
+        return me
+
+    def book_state(self, me):
+        """
+        Snapshot of the order book
+        """
+        order_book = me.order_books[TestClone.instmt]
+        order_book.validate()
+        return dict(
+            ((side, price), [(o.order_id, o.qty, o.cum_qty, o.leaves_qty)
+                             for o in level])
+            for side, levels in ((lme.Side.BUY, order_book.bids),
+                                 (lme.Side.SELL, order_book.asks))
+            for price, level in levels.items())
+
+    def test_pickle(self):
+        me = self.create_engine()
+        me.add_order(TestClone.instmt, TestClone.price - 1,
+                     TestClone.lot_size / 2, lme.Side.SELL)
+
+        unpickled = pickle.loads(pickle.dumps(me))
+        self.assertEqual(self.book_state(me), self.book_state(unpickled))
+        self.assertEqual(me.curr_order_id, unpickled.curr_order_id)
+        self.assertEqual(me.curr_trade_id, unpickled.curr_trade_id)
+
+        # Both engines match and expire in the same way
+        for engine in (me, unpickled):
+            _, trades = engine.add_order(TestClone.instmt, TestClone.price + 2,
+                                         TestClone.lot_size * 3, lme.Side.BUY)
+            self.assertEqual(
+                [(3, 22, TestClone.price + 1, 2.0),
+                 (4, 2, TestClone.price + 1, 1.0),
+                 (5, 4, TestClone.price + 1, 1.0),
+                 (6, 22, TestClone.price + 2, 1.0),
+                 (7, 6, TestClone.price + 2, 1.0)],
+                [(t.trade_id, t.order_id, t.trade_price, t.trade_qty)
+                 for t in trades])
+            self.assertEqual(10, len(engine.advance_time(100)))
+        self.assertEqual(self.book_state(me), self.book_state(unpickled))
+
+        trade = pickle.loads(pickle.dumps(trades[0]))
+        self.assertEqual((3, 22, TestClone.price + 1, 2.0, lme.Side.BUY),
+                         (trade.trade_id, trade.order_id, trade.trade_price,
+                          trade.trade_qty, trade.trade_side))
+
+        report = pickle.loads(pickle.dumps(lme.ExecutionReport(
+            lme.ExecType.FILL, 1, TestClone.instmt, 1.0, 2.0, lme.Side.BUY,
+            2.0, 0.0, 3, 1.0, 2.0, 4)))
+        self.assertEqual((4, lme.ExecType.FILL, 1, 3),
+                         (report.seq_no, report.exec_type, report.order_id,
+                          report.trade_id))
+
+    def test_clone(self):
+        me = self.create_engine()
+        state = self.book_state(me)
+
+        # Sweep the asks, amend and cancel bids, and expire in the clone
+        clone = me.clone()
+        _, trades = clone.add_order(TestClone.instmt, TestClone.price + 3,
+                                    TestClone.lot_size * 5, lme.Side.BUY)
+        self.assertEqual(8, len(trades))
+        self.assertEqual(21, trades[0].order_id)
+        clone.amend_order(1, TestClone.instmt, TestClone.price - 1,
+                          TestClone.lot_size / 2)
+        clone.cancel_order(3, TestClone.instmt)
+        self.assertEqual(9, len(clone.advance_time(100)))
+        clone_state = self.book_state(clone)
+
+        # The engine is not modified
+        self.assertEqual(state, self.book_state(me))
+        self.assertEqual(20, me.curr_order_id)
+        self.assertEqual(1.0, me.order_books[TestClone.instmt].order_id_map[1].leaves_qty)
+
+        # The clone is not modified by the engine
+        _, trades = me.add_order(TestClone.instmt, TestClone.price - 2,
+                                 TestClone.lot_size * 3, lme.Side.SELL)
+        self.assertEqual(5, len(trades))
+        self.assertEqual(21, trades[0].order_id)
+        me.cancel_all_orders(TestClone.instmt)
+        self.assertEqual({}, self.book_state(me))
+        self.assertEqual(clone_state, self.book_state(clone))
+
+    def test_clone_keeps_engine_orders(self):
+        me = lme.LightMatchingEngine()
+        order, _ = me.add_order(TestClone.instmt, TestClone.price,
+                                TestClone.lot_size * 2, lme.Side.BUY)
+        order2, _ = me.add_order(TestClone.instmt, TestClone.price,
+                                 TestClone.lot_size, lme.Side.BUY)
+        clone = me.clone()
+
+        # The orders held by the caller are updated by the engine
+        me.add_order(TestClone.instmt, TestClone.price, TestClone.lot_size,
+                     lme.Side.SELL)
+        self.assertEqual(1.0, order.cum_qty)
+        self.assertEqual(1.0, order.leaves_qty)
+        self.assertTrue(me.order_books[TestClone.instmt].bids[TestClone.price][0] is order)
+        self.assertTrue(me.cancel_order(order.order_id, TestClone.instmt) is order)
+        self.assertEqual(0, order.leaves_qty)
+        self.assertTrue(me.cancel_order(order2.order_id, TestClone.instmt) is order2)
+
+        # The clone keeps the state at the time of cloning
+        clone_order = clone.order_books[TestClone.instmt].order_id_map[1]
+        self.assertFalse(clone_order is order)
+        self.assertEqual((0.0, 2.0), (clone_order.cum_qty, clone_order.leaves_qty))
+        self.assertEqual(2, len(clone.order_books[TestClone.instmt].bids[TestClone.price]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+import lightmatchingengine.lightmatchingengine as lme
+import random
+import unittest
+
+class ReferenceOrder(object):
+    """
+    Order of the reference engine
+    """
+    def __init__(self, order_id, instmt, price, qty, side):
+        self.order_id = order_id
+        self.instmt = instmt
+        self.price = price
+        self.qty = qty
+        self.cum_qty = 0.0
+        self.leaves_qty = qty
+        self.side = side
+
+
+class ReferenceEngine(object):
+    """
+    Naive price-time priority matching engine, keeping the resting orders
+    of each instrument in a plain list in arrival order. A market order,
+    i.e. of zero price, matches at any price and its remaining quantity is
+    cancelled.
+    """
+    def __init__(self):
+        self.resting_orders = {}
+        self.curr_order_id = 0
+        self.curr_trade_id = 0
+
+    def add_order(self, instmt, price, qty, side):
+        resting_orders = self.resting_orders.setdefault(instmt, [])
+        self.curr_order_id += 1
+        order = ReferenceOrder(self.curr_order_id, instmt, price, qty, side)
+        trades = []
+
+        while order.leaves_qty >= 1e-9:
+            if side == lme.Side.BUY:
+                prices = [o.price for o in resting_orders
+                          if o.side == lme.Side.SELL and
+                          (price == 0.0 or o.price <= price)]
+                best_price = min(prices) if len(prices) > 0 else None
+            else:
+                prices = [o.price for o in resting_orders
+                          if o.side == lme.Side.BUY and
+                          (price == 0.0 or o.price >= price)]
+                best_price = max(prices) if len(prices) > 0 else None
+
+            if best_price is None:
+                break
+
+            level = [o for o in resting_orders
+                     if o.side != side and o.price == best_price]
+            match_qty = min(sum(o.leaves_qty for o in level), order.leaves_qty)
+            self.curr_trade_id += 1
+            order.cum_qty += match_qty
+            order.leaves_qty -= match_qty
+            trades.append((order.order_id, instmt, best_price, match_qty,
+                           side, self.curr_trade_id))
+
+            for hit_order in level:
+                if match_qty < 1e-9:
+                    break
+                hit_qty = min(match_qty, hit_order.leaves_qty)
+                self.curr_trade_id += 1
+                hit_order.cum_qty += hit_qty
+                hit_order.leaves_qty -= hit_qty
+                match_qty -= hit_qty
+                trades.append((hit_order.order_id, instmt, best_price,
+                               hit_qty, hit_order.side, self.curr_trade_id))
+                if hit_order.leaves_qty < 1e-9:
+                    resting_orders.remove(hit_order)
+
+        if order.leaves_qty >= 1e-9:
+            if price == 0.0:
+                order.leaves_qty = 0.0
+            else:
+                resting_orders.append(order)
+
+        return order, trades
+
+    def find_order(self, order_id, instmt):
+        for order in self.resting_orders.get(instmt, []):
+            if order.order_id == order_id:
+                return order
+        return None
+
+    def cancel_order(self, order_id, instmt):
+        order = self.find_order(order_id, instmt)
+        if order is None:
+            return None
+        self.resting_orders[instmt].remove(order)
+        order.leaves_qty = 0.0
+        return order
+
+    def amend_order(self, order_id, instmt, amended_price, amended_qty):
+        order = self.find_order(order_id, instmt)
+        if order is None:
+            return None
+        if order.price == amended_price and amended_qty <= order.qty:
+            order.leaves_qty -= order.qty - amended_qty
+            order.qty = amended_qty
+            return order, []
+        self.cancel_order(order_id, instmt)
+        return self.add_order(instmt, amended_price, amended_qty, order.side)
+
+    def depth(self, instmt):
+        depth = {}
+        for order in self.resting_orders.get(instmt, []):
+            depth.setdefault((order.side, order.price), []).append(
+                (order.order_id, order.leaves_qty))
+        return depth
+
+
+def order_state(order):
+    """
+    Comparable state of an order of either engine
+    """
+    if order is None:
+        return None
+    return (order.order_id, order.instmt, order.price, order.qty,
+            order.cum_qty, order.leaves_qty, order.side)
+
+
+def trade_state(trade):
+    """
+    Comparable state of a trade of the engine under test
+    """
+    return (trade.order_id, trade.instmt, trade.trade_price, trade.trade_qty,
+            trade.trade_side, trade.trade_id)
+
+
+def engine_depth(engine, instmt):
+    """
+    Depth of the engine under test in the reference engine layout
+    """
+    depth = {}
+    order_book = engine.order_books.get(instmt)
+    if order_book is None:
+        return depth
+    for side, levels in ((lme.Side.BUY, order_book.bids),
+                         (lme.Side.SELL, order_book.asks)):
+        for price, level in levels.items():
+            depth[(side, price)] = [(o.order_id, o.leaves_qty) for o in level]
+    return depth
+
+
+def run_differential(test, engine, seed, num_ops, instmts=("A", "B")):
+    """
+    Run a seeded random stream of limit and market orders, cancels and
+    amends through the reference engine and the engine under test,
+    comparing every returned order and trade, and the depth and invariants
+    after every operation
+    """
+    rng = random.Random(seed)
+    reference = ReferenceEngine()
+
+    for i in range(num_ops):
+        instmt = rng.choice(instmts)
+        action = rng.random()
+        max_order_id = reference.curr_order_id
+
+        if action < 0.05:
+            args = (instmt, 0.0, float(rng.randint(1, 30)),
+                    rng.choice((lme.Side.BUY, lme.Side.SELL)))
+            expected = reference.add_order(*args)
+            actual = engine.add_order(*args)
+        elif action < 0.6 or instmt not in reference.resting_orders:
+            args = (instmt, float(rng.randint(90, 110)),
+                    float(rng.randint(1, 10)),
+                    rng.choice((lme.Side.BUY, lme.Side.SELL)))
+            expected = reference.add_order(*args)
+            actual = engine.add_order(*args)
+        elif action < 0.85:
+            args = (rng.randint(1, max_order_id), instmt)
+            expected = reference.cancel_order(*args)
+            actual = engine.cancel_order(*args)
+            expected = order_state(expected)
+            actual = order_state(actual)
+        else:
+            order = reference.find_order(rng.randint(1, max_order_id), instmt)
+            if order is None:
+                continue
+            args = (order.order_id, instmt,
+                    rng.choice((order.price, float(rng.randint(90, 110)))),
+                    order.cum_qty + rng.randint(1, 10))
+            expected = reference.amend_order(*args)
+            actual = engine.amend_order(*args)
+
+        if isinstance(expected, tuple) and len(expected) == 2:
+            expected = (order_state(expected[0]), expected[1])
+            actual = (order_state(actual[0]),
+                      [trade_state(trade) for trade in actual[1]])
+
+        test.assertEqual(expected, actual,
+                         "Seed %s diverges at operation %d" % (seed, i))
+        test.assertEqual(reference.depth(instmt), engine_depth(engine, instmt),
+                         "Seed %s diverges at operation %d" % (seed, i))
+        if instmt in engine.order_books:
+            engine.order_books[instmt].validate()
+
+
+class TestDifferentialFuzz(unittest.TestCase):
+    num_seeds = 20
+    num_ops = 2000
+
+    def test_differential_fuzz(self):
+        for seed in range(TestDifferentialFuzz.num_seeds):
+            run_differential(self, lme.LightMatchingEngine(), seed,
+                             TestDifferentialFuzz.num_ops)
+
+    def test_validate(self):
+        me = lme.LightMatchingEngine()
+        for price in (99.0, 99.0, 101.0):
+            me.add_order("A", price, 1.0,
+                         lme.Side.BUY if price < 100 else lme.Side.SELL)
+        order_book = me.order_books["A"]
+        order_book.validate()
+
+        # Broken time priority
+        order_book.bids[99.0].reverse()
+        with self.assertRaises(AssertionError):
+            order_book.validate()
+        order_book.bids[99.0].reverse()
+
+        # Missing order in the order id map
+        order = order_book.order_id_map.pop(3)
+        with self.assertRaises(AssertionError):
+            order_book.validate()
+        order_book.order_id_map[3] = order
+        order_book.validate()
+
+        # Market order price level
+        order_book.asks[0.0] = [lme.Order(4, "A", 0.0, 1.0, lme.Side.SELL)]
+        order_book.order_id_map[4] = order_book.asks[0.0][0]
+        with self.assertRaises(AssertionError):
+            order_book.validate()
+        del order_book.asks[0.0]
+        del order_book.order_id_map[4]
+        order_book.validate()
+
+        # Crossed book
+        order_book.bids[101.0] = order_book.bids.pop(99.0)
+        for order in order_book.bids[101.0]:
+            order.price = 101.0
+        with self.assertRaises(AssertionError):
+            order_book.validate()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+import lightmatchingengine.lightmatchingengine as lme
+from lightmatchingengine.sinks import (
+    EventDrainer, FileSink, QueueSink, SharedMemoryReader)
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+class TestEventStream(unittest.TestCase):
+    instmt = "TestingInstrument"
+    price = 100.0
+    lot_size = 1.0
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def check_report(self, report, seq_no, exec_type, order_id, cum_qty,
+                     leaves_qty, trade_id=0):
+        """
+        Check the execution report information
+        """
+        self.assertEqual(seq_no, report.seq_no)
+        self.assertEqual(exec_type, report.exec_type)
+        self.assertEqual(order_id, report.order_id)
+        self.assertEqual(TestEventStream.instmt, report.instmt)
+        self.assertEqual(cum_qty, report.cum_qty)
+        self.assertEqual(leaves_qty, report.leaves_qty)
+        self.assertEqual(trade_id, report.trade_id)
+
+    def run_orders(self, me):
+        """
+        Place, fill, amend and cancel orders
+        """
+        me.add_order(TestEventStream.instmt, TestEventStream.price,
+                     TestEventStream.lot_size * 2, lme.Side.BUY)
+        me.add_order(TestEventStream.instmt, TestEventStream.price,
+                     TestEventStream.lot_size, lme.Side.SELL)
+        me.amend_order(1, TestEventStream.instmt, TestEventStream.price,
+                       TestEventStream.lot_size * 1.5)
+        me.cancel_order(1, TestEventStream.instmt)
+        me.cancel_order(1, TestEventStream.instmt)
+
+    def test_reports(self):
+        me = lme.LightMatchingEngine(lme.EventRingBuffer())
+        self.run_orders(me)
+
+        reports = me.event_buffer.poll()
+        self.assertEqual(7, len(reports))
+        self.check_report(reports[0], 1, lme.ExecType.NEW, 1, 0, 2)
+        self.check_report(reports[1], 2, lme.ExecType.NEW, 2, 0, 1)
+        self.check_report(reports[2], 3, lme.ExecType.FILL, 2, 1, 0, 1)
+        self.check_report(reports[3], 4, lme.ExecType.PARTIAL_FILL, 1, 1, 1, 2)
+        self.check_report(reports[4], 5, lme.ExecType.AMEND, 1, 1, 0.5)
+        self.check_report(reports[5], 6, lme.ExecType.CANCEL, 1, 1, 0)
+        self.check_report(reports[6], 7, lme.ExecType.REJECT, 1, 0, 0)
+        self.assertEqual([], me.event_buffer.poll())
+
+    def test_expire_report(self):
+        me = lme.LightMatchingEngine(lme.EventRingBuffer())
+        me.add_order(TestEventStream.instmt, TestEventStream.price,
+                     TestEventStream.lot_size, lme.Side.BUY, expire_time=10)
+        me.advance_time(10)
+
+        reports = me.event_buffer.poll()
+        self.assertEqual(2, len(reports))
+        self.check_report(reports[1], 2, lme.ExecType.EXPIRE, 1, 0, 0)
+
+    def test_event_buffer(self):
+        me = lme.LightMatchingEngine(lme.EventBuffer())
+        self.run_orders(me)
+        self.assertEqual(7, me.event_buffer.seq_no)
+        self.assertEqual(2, me.curr_order_id)
+
+    def test_ring_buffer_overrun(self):
+        event_buffer = lme.EventRingBuffer(3)
+        self.assertEqual(4, event_buffer.capacity)
+
+        for i in range(10):
+            event_buffer.publish(lme.ExecutionReport(
+                lme.ExecType.NEW, i, TestEventStream.instmt, 0, 0, 0, 0, 0))
+
+        self.assertEqual(4, len(event_buffer))
+        self.assertEqual([7, 8], [r.seq_no for r in event_buffer.poll(2)])
+        self.assertEqual(6, event_buffer.dropped)
+        self.assertEqual([9, 10], [r.seq_no for r in event_buffer.poll()])
+
+    def test_sinks(self):
+        event_buffer = lme.EventRingBuffer()
+        me = lme.LightMatchingEngine(event_buffer)
+        queue = Queue()
+        file_path = os.path.join(self.tmp_dir, 'reports.csv')
+        drainer = EventDrainer(event_buffer, [
+            QueueSink(queue), FileSink(file_path)])
+
+        drainer.start()
+        self.run_orders(me)
+        drainer.stop()
+
+        self.assertEqual(list(range(1, 8)),
+                         [queue.get().seq_no for _ in range(queue.qsize())])
+
+        with open(file_path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(8, len(lines))
+        self.assertEqual(FileSink.FIELDS, lines[0].split(','))
+        self.assertTrue(lines[3].startswith('3,3,2,%s,' % TestEventStream.instmt))
+
+    def test_shared_memory_ring_buffer(self):
+        shm_path = os.path.join(self.tmp_dir, 'reports.shm')
+        event_buffer = lme.SharedMemoryRingBuffer(shm_path, capacity=4)
+        me = lme.LightMatchingEngine(event_buffer)
+        reader = SharedMemoryReader(shm_path)
+
+        me.add_order(TestEventStream.instmt, TestEventStream.price,
+                     TestEventStream.lot_size * 2, lme.Side.BUY)
+        reports = reader.poll()
+        self.assertEqual(1, len(reports))
+        self.check_report(reports[0], 1, lme.ExecType.NEW, 1, 0, 2)
+        self.assertEqual(lme.Side.BUY, reports[0].side)
+        self.assertEqual(TestEventStream.price, reports[0].price)
+
+        self.run_orders(me)
+        self.assertEqual(8, event_buffer.seq_no)
+        reports = reader.poll()
+        self.assertEqual(3, reader.dropped)
+        self.assertEqual([5, 6, 7, 8], [r.seq_no for r in reports])
+        self.check_report(reports[0], 5, lme.ExecType.PARTIAL_FILL, 1, 1, 1, 2)
+        self.check_report(reports[3], 8, lme.ExecType.REJECT, 1, 0, 0)
+        self.assertEqual([], reader.poll())
+
+        reader.close()
+        event_buffer.close()
+
+    def test_shared_memory_torn_record(self):
+        shm_path = os.path.join(self.tmp_dir, 'reports.shm')
+        event_buffer = lme.SharedMemoryRingBuffer(shm_path, capacity=4)
+        me = lme.LightMatchingEngine(event_buffer)
+        reader = SharedMemoryReader(shm_path)
+        me.add_order(TestEventStream.instmt, TestEventStream.price,
+                     TestEventStream.lot_size, lme.Side.BUY)
+        me.add_order(TestEventStream.instmt, TestEventStream.price,
+                     TestEventStream.lot_size, lme.Side.BUY)
+
+        # Simulate the writer in the middle of overwriting the first record
+        with open(shm_path, 'r+b') as f:
+            buffer = mmap.mmap(f.fileno(), 0)
+            struct.pack_into('<q', buffer,
+                             struct.calcsize(lme.SHARED_MEMORY_HEADER_FORMAT), 0)
+            buffer.close()
+
+        reports = reader.poll()
+        self.assertEqual(1, reader.dropped)
+        self.assertEqual([2], [r.seq_no for r in reports])
+
+        reader.close()
+        event_buffer.close()
+
+if __name__ == '__main__':
+    unittest.main()
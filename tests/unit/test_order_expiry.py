@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+import lightmatchingengine.lightmatchingengine as lme
+import random
+import unittest
+
+class TestOrderExpiry(unittest.TestCase):
+    instmt = "TestingInstrument"
+    price = 100.0
+    lot_size = 1.0
+
+    def test_timer_wheel(self):
+        random.seed(42)
+        wheel = lme.TimerWheel(slot_bits=4)
+        expire_times = {}
+        for i in range(1000):
+            expire_times[i] = random.randint(1, 1 << 20)
+            wheel.add(expire_times[i], i)
+
+        self.assertEqual(1000, len(wheel))
+
+        current_time = 0
+        while len(expire_times) > 0:
+            current_time += random.randint(1, 1 << 12)
+            expired = wheel.advance(current_time)
+            self.assertEqual(
+                sorted(i for i, t in expire_times.items() if t <= current_time),
+                sorted(expired))
+            for i in expired:
+                del expire_times[i]
+
+        self.assertEqual(0, len(wheel))
+
+    def test_timer_wheel_large_jump(self):
+        wheel = lme.TimerWheel(current_time=5)
+        wheel.add(1, "overdue")
+        wheel.add(1600000000000000000, "far")
+        self.assertEqual(["overdue"], wheel.advance(5))
+        self.assertEqual([], wheel.advance(1599999999999999999))
+        self.assertEqual(["far"], wheel.advance(1600000000000000000))
+
+    def test_expire_order(self):
+        me = lme.LightMatchingEngine()
+
+        # Place a day order, a good till cancel order and a later day order
+        order1, _ = me.add_order(TestOrderExpiry.instmt,
+                                 TestOrderExpiry.price,
+                                 TestOrderExpiry.lot_size,
+                                 lme.Side.BUY, expire_time=100)
+        order2, _ = me.add_order(TestOrderExpiry.instmt,
+                                 TestOrderExpiry.price,
+                                 TestOrderExpiry.lot_size,
+                                 lme.Side.BUY)
+        order3, _ = me.add_order(TestOrderExpiry.instmt,
+                                 TestOrderExpiry.price + 1,
+                                 TestOrderExpiry.lot_size,
+                                 lme.Side.BUY, expire_time=200)
+        self.assertEqual(100, order1.expire_time)
+        self.assertEqual(0, order2.expire_time)
+
+        self.assertEqual([], me.advance_time(99))
+        self.assertEqual([order1], me.advance_time(100))
+        self.assertEqual(0, order1.leaves_qty)
+        order_book = me.order_books[TestOrderExpiry.instmt]
+        self.assertEqual([order2], order_book.bids[TestOrderExpiry.price])
+        self.assertTrue(order1.order_id not in order_book.order_id_map)
+
+        # The expiry of a fully filled order is ignored
+        _, trades = me.add_order(TestOrderExpiry.instmt,
+                                 TestOrderExpiry.price + 1,
+                                 TestOrderExpiry.lot_size,
+                                 lme.Side.SELL)
+        self.assertEqual(2, len(trades))
+        self.assertEqual([], me.advance_time(200))
+        self.assertEqual([order2], order_book.bids[TestOrderExpiry.price])
+        self.assertEqual(0, len(order_book.asks))
+
+    def test_expire_amended_order(self):
+        me = lme.LightMatchingEngine()
+
+        order, _ = me.add_order(TestOrderExpiry.instmt,
+                                TestOrderExpiry.price,
+                                TestOrderExpiry.lot_size,
+                                lme.Side.SELL, expire_time=100)
+        amended_order, _ = me.amend_order(order.order_id,
+                                          TestOrderExpiry.instmt,
+                                          TestOrderExpiry.price + 1,
+                                          TestOrderExpiry.lot_size)
+        self.assertEqual(100, amended_order.expire_time)
+        self.assertEqual([amended_order], me.advance_time(100))
+        self.assertEqual(0, len(me.order_books[TestOrderExpiry.instmt].asks))
+
+    def test_add_expired_order(self):
+        me = lme.LightMatchingEngine(lme.EventRingBuffer())
+        me.add_order(TestOrderExpiry.instmt, TestOrderExpiry.price,
+                     TestOrderExpiry.lot_size, lme.Side.SELL)
+        me.advance_time(1000)
+
+        # The order matches but its remaining quantity does not rest
+        order, trades = me.add_order(TestOrderExpiry.instmt,
+                                     TestOrderExpiry.price,
+                                     TestOrderExpiry.lot_size * 3,
+                                     lme.Side.BUY, expire_time=5)
+        self.assertEqual(2, len(trades))
+        self.assertEqual(TestOrderExpiry.lot_size, order.cum_qty)
+        self.assertEqual(0, order.leaves_qty)
+        order_book = me.order_books[TestOrderExpiry.instmt]
+        self.assertEqual(0, len(order_book.bids))
+        self.assertEqual(0, len(order_book.order_id_map))
+        self.assertEqual(lme.ExecType.EXPIRE,
+                         me.event_buffer.poll()[-1].exec_type)
+
+        # An expire time at the engine time is expired too
+        order, trades = me.add_order(TestOrderExpiry.instmt,
+                                     TestOrderExpiry.price,
+                                     TestOrderExpiry.lot_size,
+                                     lme.Side.SELL, expire_time=1000)
+        self.assertEqual(0, len(trades))
+        self.assertEqual(0, order.leaves_qty)
+        self.assertEqual(0, len(order_book.asks))
+
+        _, trades = me.add_order(TestOrderExpiry.instmt,
+                                 TestOrderExpiry.price,
+                                 TestOrderExpiry.lot_size, lme.Side.BUY)
+        self.assertEqual(0, len(trades))
+
+    def test_expire_deep_level(self):
+        me = lme.LightMatchingEngine()
+
+        # Place a deep level where every tenth order expires on its own tick
+        orders = []
+        for i in range(20000):
+            order, _ = me.add_order(TestOrderExpiry.instmt,
+                                    TestOrderExpiry.price,
+                                    TestOrderExpiry.lot_size, lme.Side.BUY,
+                                    expire_time=i // 10 + 1 if i % 10 == 0
+                                    else 100000)
+            orders.append(order)
+
+        order_book = me.order_books[TestOrderExpiry.instmt]
+        price_level = order_book.bids[TestOrderExpiry.price]
+        for tick in range(1, 2001):
+            self.assertEqual([orders[(tick - 1) * 10]], me.advance_time(tick))
+
+        # The expired orders are removed in place without rebuilding the level
+        self.assertTrue(order_book.bids[TestOrderExpiry.price] is price_level)
+        self.assertEqual([o for i, o in enumerate(orders) if i % 10 != 0],
+                         price_level)
+        order_book.validate()
+
+        # The remaining orders expire at once
+        self.assertEqual(18000, len(me.advance_time(100000)))
+        self.assertEqual(0, len(order_book.bids))
+        self.assertEqual(0, len(order_book.order_id_map))
+
+    def test_cancel_all_orders(self):
+        me = lme.LightMatchingEngine()
+
+        orders = []
+        for i in range(10):
+            if i < 5:
+                side, price = lme.Side.BUY, TestOrderExpiry.price - i % 2
+            else:
+                side, price = lme.Side.SELL, TestOrderExpiry.price + 1 + i % 2
+            order, _ = me.add_order(TestOrderExpiry.instmt, price,
+                                    TestOrderExpiry.lot_size, side,
+                                    expire_time=100)
+            orders.append(order)
+
+        order_book = me.order_books[TestOrderExpiry.instmt]
+        self.assertEqual(2, len(order_book.bids))
+
+        del_orders = me.cancel_all_orders(TestOrderExpiry.instmt)
+        self.assertEqual(orders, del_orders)
+        self.assertTrue(all(order.leaves_qty == 0 for order in orders))
+        self.assertEqual(0, len(order_book.bids))
+        self.assertEqual(0, len(order_book.asks))
+        self.assertEqual(0, len(order_book.order_id_map))
+
+        # The scheduled expiries of the cancelled orders are ignored
+        self.assertEqual([], me.advance_time(100))
+
+if __name__ == '__main__':
+    unittest.main()
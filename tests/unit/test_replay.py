@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+import lightmatchingengine.lightmatchingengine as lme
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+class TestReplay(unittest.TestCase):
+    instmt = "TestingInstrument"
+    messages = [
+        # timestamp, msg_type, order_id, side, price, qty
+        (1, 'A', 1001, 'B', 100.0, 3.0),
+        (2, 'A', 1002, 'B', 99.0, 1.0),
+        (3, 'A', 1003, 'S', 101.0, 2.0),
+        (4, 'M', 1002, 'B', 98.0, 2.0),
+        (5, 'A', 1004, 'S', 100.0, 1.0),
+        (6, 'X', 1003, 'S', 0.0, 0.0),
+        (7, 'A', 1005, 'S', 102.0, 1.0),
+    ]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmp_dir, 'replay.csv')
+        with open(self.csv_path, 'w') as f:
+            f.write('timestamp,msg_type,order_id,side,price,qty\n')
+            for message in TestReplay.messages:
+                f.write('%d,%s,%d,%s,%s,%s\n' % message)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def check_replayer(self, replayer):
+        """
+        Check the order book rebuilt from the messages
+        """
+        self.assertEqual(7, replayer.num_messages)
+        self.assertEqual({1001: 1, 1002: 4, 1005: 6}, replayer.order_id_map)
+        order_book = replayer.engine.order_books[TestReplay.instmt]
+        self.assertEqual([100.0, 98.0], list(order_book.bids.keys()))
+        self.assertEqual([102.0], list(order_book.asks.keys()))
+        self.assertEqual(2.0, order_book.bids[100.0][0].leaves_qty)
+        self.assertEqual(2.0, order_book.bids[98.0][0].qty)
+
+    def test_replay_csv(self):
+        replayer = lme.Replayer(lme.LightMatchingEngine(), TestReplay.instmt)
+        self.assertEqual(7, replayer.replay_csv(self.csv_path))
+        self.check_replayer(replayer)
+
+    def test_replay_file(self):
+        replay_path = os.path.join(self.tmp_dir, 'replay.bin')
+        self.assertEqual(7, lme.csv_to_replay_file(self.csv_path, replay_path))
+        self.assertEqual(7 * struct.calcsize(lme.REPLAY_RECORD_FORMAT),
+                         os.path.getsize(replay_path))
+
+        samples = []
+        replayer = lme.Replayer(
+            lme.LightMatchingEngine(), TestReplay.instmt,
+            sampler=lambda timestamp, order_book: samples.append(
+                (timestamp, len(order_book.order_id_map))),
+            sample_interval=3)
+        self.assertEqual(7, replayer.replay_file(replay_path, chunk_records=2))
+        self.check_replayer(replayer)
+        self.assertEqual([(3, 3), (6, 2)], samples)
+
+    def test_amend_filled_order(self):
+        record = struct.Struct(lme.REPLAY_RECORD_FORMAT)
+        replayer = lme.Replayer(lme.LightMatchingEngine(), TestReplay.instmt)
+        replayer.replay_buffer(b''.join([
+            record.pack(1, 1, 100.0, 3.0, ord('A'), lme.Side.BUY),
+            record.pack(2, 2, 100.0, 2.0, ord('A'), lme.Side.SELL),
+            record.pack(3, 1, 100.0, 2.5, ord('M'), lme.Side.BUY)]))
+
+        # The amended quantity is the total order quantity
+        order = replayer.engine.order_books[TestReplay.instmt].order_id_map[1]
+        self.assertEqual((2.5, 2.0, 0.5),
+                         (order.qty, order.cum_qty, order.leaves_qty))
+
+        # The order is cancelled if it is already filled up to the amended
+        # quantity
+        replayer.replay_buffer(
+            record.pack(4, 1, 100.0, 1.0, ord('M'), lme.Side.BUY))
+        self.assertEqual(0.0, order.leaves_qty)
+        self.assertEqual({}, replayer.order_id_map)
+        self.assertEqual({}, replayer.engine.order_books[TestReplay.instmt].bids)
+
+    def test_amend_price_filled_order(self):
+        record = struct.Struct(lme.REPLAY_RECORD_FORMAT)
+        replayer = lme.Replayer(lme.LightMatchingEngine(), TestReplay.instmt)
+        replayer.replay_buffer(b''.join([
+            record.pack(1, 1, 100.0, 3.0, ord('A'), lme.Side.BUY),
+            record.pack(2, 2, 100.0, 2.0, ord('A'), lme.Side.SELL),
+            record.pack(3, 1, 99.0, 3.0, ord('M'), lme.Side.BUY)]))
+
+        # Only the remaining quantity rests at the amended price
+        order_book = replayer.engine.order_books[TestReplay.instmt]
+        self.assertEqual([99.0], list(order_book.bids.keys()))
+        order = order_book.bids[99.0][0]
+        self.assertEqual((1.0, 0.0, 1.0),
+                         (order.qty, order.cum_qty, order.leaves_qty))
+        self.assertEqual({1: order.order_id}, replayer.order_id_map)
+        self.assertEqual({1: 2.0}, replayer.filled_qty_map)
+
+        # The amended quantities still include the filled quantity
+        replayer.replay_buffer(b''.join([
+            record.pack(4, 1, 99.0, 4.0, ord('M'), lme.Side.BUY),
+            record.pack(5, 1, 99.0, 3.5, ord('M'), lme.Side.BUY)]))
+        order = order_book.bids[99.0][0]
+        self.assertEqual((1.5, 0.0, 1.5),
+                         (order.qty, order.cum_qty, order.leaves_qty))
+
+        replayer.replay_buffer(
+            record.pack(6, 1, 99.0, 2.0, ord('M'), lme.Side.BUY))
+        self.assertEqual(0.0, order.leaves_qty)
+        self.assertEqual({}, order_book.bids)
+        self.assertEqual({}, replayer.order_id_map)
+        self.assertEqual({}, replayer.filled_qty_map)
+
+    def test_invalid_sampler(self):
+        with self.assertRaises(AssertionError):
+            lme.Replayer(lme.LightMatchingEngine(), TestReplay.instmt,
+                         sample_interval=10)
+
+    def test_invalid_message(self):
+        replayer = lme.Replayer(lme.LightMatchingEngine(), TestReplay.instmt)
+        buffer = struct.pack(lme.REPLAY_RECORD_FORMAT, 1, 1, 0, 0, ord('Z'), 1)
+        with self.assertRaises(ValueError):
+            replayer.replay_buffer(buffer)
+
+if __name__ == '__main__':
+    unittest.main()